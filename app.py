@@ -3,34 +3,60 @@ import ssl
 import sys
 import socket
 import platform
+import functools
+import collections
+import concurrent.futures
+import threading
+import time
 import traceback
+import hashlib
+import json
 from datetime import datetime, timezone
 from urllib.parse import urlparse
 
 import certifi
 from dotenv import load_dotenv
+from flask import request
 from pymongo import MongoClient
 from pymongo.errors import PyMongoError
 
 import dash
 from dash import html, dcc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 
 load_dotenv()
 
+# Env vars don't change after start on Render/gunicorn; read the URI once.
+MONGODB_URI = os.getenv("MONGODB_URI", "")
+_CA_FILE = certifi.where()
+
 APP_START_UTC = datetime.now(timezone.utc)
+APP_START_ISO = APP_START_UTC.isoformat()
 
 MAX_LOG_LINES = 300
-LOG_LINES = []
+LOG_LINES = collections.deque(maxlen=MAX_LOG_LINES)
+_LOG_LOCK = threading.Lock()
+# [epoch second, formatted prefix] so bursts within one second reuse the strftime
+_LAST_TS = [0, ""]
 
 
 def log(msg: str) -> None:
-    ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
-    LOG_LINES.append(f"[{ts}] {msg}")
-    if len(LOG_LINES) > MAX_LOG_LINES:
-        del LOG_LINES[: len(LOG_LINES) - MAX_LOG_LINES]
+    t = int(time.time())
+    with _LOG_LOCK:
+        if t != _LAST_TS[0]:
+            _LAST_TS[0] = t
+            _LAST_TS[1] = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(t))
+        LOG_LINES.append(f"[{_LAST_TS[1]}] {msg}")
+
+
+def log_snapshot() -> list[str]:
+    with _LOG_LOCK:
+        return list(LOG_LINES)
 
 
+# MONGODB_URI is fixed for the life of the process, so these pure helpers only
+# ever urlparse it once.
+@functools.lru_cache(maxsize=8)
 def safe_uri_summary(uri: str) -> str:
     if not uri:
         return "<missing>"
@@ -44,6 +70,7 @@ def safe_uri_summary(uri: str) -> str:
         return "<unable to parse uri safely>"
 
 
+@functools.lru_cache(maxsize=8)
 def get_atlas_host_from_uri(uri: str) -> str | None:
     if not uri:
         return None
@@ -92,141 +119,290 @@ def srv_records_debug(atlas_host: str) -> dict:
     return out
 
 
+# SRV/A lookups are blocking network I/O; Atlas SRV TTLs are on the order of minutes,
+# so memoize per (host, time bucket). A new bucket naturally expires old entries.
+DNS_CACHE_TTL_S = 300
+
+
+def _dns_bucket() -> int:
+    return int(time.monotonic() // DNS_CACHE_TTL_S)
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_srv(atlas_host: str, bucket: int) -> dict:
+    return srv_records_debug(atlas_host)
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_host_ips(host: str, bucket: int) -> dict:
+    return resolve_host_ips(host)
+
+
+# getaddrinfo releases the GIL, so shard hosts can be resolved concurrently.
+_DNS_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="dns")
+
+
+def clear_dns_cache() -> None:
+    _cached_srv.cache_clear()
+    _cached_host_ips.cache_clear()
+
+
 _MONGO_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+MONGO_MAX_POOL_SIZE = 10
 
 
 def get_mongo_client(uri: str, timeout_ms: int = 15000) -> MongoClient:
     global _MONGO_CLIENT
     if _MONGO_CLIENT is None:
-        _MONGO_CLIENT = MongoClient(
-            uri,
-            tls=True,
-            tlsCAFile=certifi.where(),
-            serverSelectionTimeoutMS=timeout_ms,
-            connectTimeoutMS=timeout_ms,
-            socketTimeoutMS=timeout_ms,
-        )
-        log("MongoClient created (pooled)")
+        with _CLIENT_LOCK:
+            # re-check: another thread may have built it while we waited
+            if _MONGO_CLIENT is None:
+                _MONGO_CLIENT = MongoClient(
+                    uri,
+                    tls=True,
+                    tlsCAFile=_CA_FILE,
+                    serverSelectionTimeoutMS=timeout_ms,
+                    connectTimeoutMS=timeout_ms,
+                    socketTimeoutMS=timeout_ms,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                )
+                log("MongoClient created (pooled)")
     return _MONGO_CLIENT
 
 
-def mongo_ping_debug(uri: str, timeout_ms: int = 15000) -> dict:
-    out = {"ok": False, "ping_ok": False, "timeout_ms": timeout_ms, "dbs": [], "error": None, "traceback": None}
+# listDatabases is an extra round-trip plus server-side enumeration; only run it
+# on an explicit refresh or once the cached list is older than DB_LIST_MAX_AGE_S.
+DB_LIST_MAX_AGE_S = 60.0
+_DB_LIST = {"ts": 0.0, "dbs": []}
+
+
+# Formatting a traceback walks every frame; during an Atlas outage that happens on
+# every poll. Keep the exception around and only format it when someone asks
+# (/debug/tb), unless DEBUG_TRACEBACKS=1 wants it inline in the debug text.
+INCLUDE_TRACEBACKS = os.getenv("DEBUG_TRACEBACKS", "") == "1"
+_LAST_EXC = {"exc": None}
+
+
+def last_traceback_text() -> str | None:
+    exc = _LAST_EXC["exc"]
+    if exc is None:
+        return None
+    return "".join(traceback.format_exception(exc))
+
+
+def mongo_ping_debug(uri: str, timeout_ms: int = 15000, full: bool = False, include_tb: bool | None = None) -> dict:
+    # only the poller calls this, so concurrent refreshes are already coalesced
+    with_dbs = full or time.monotonic() - _DB_LIST["ts"] >= DB_LIST_MAX_AGE_S
+    if include_tb is None:
+        include_tb = INCLUDE_TRACEBACKS
+    out = {
+        "ok": False,
+        "ping_ok": False,
+        "timeout_ms": timeout_ms,
+        "dbs": [],
+        "error": None,
+        "traceback": None,
+        "checked_at": datetime.now(timezone.utc),
+    }
     try:
         client = get_mongo_client(uri, timeout_ms=timeout_ms)
         client.admin.command("ping")
         out["ping_ok"] = True
 
-        try:
-            out["dbs"] = client.list_database_names()
-        except Exception as e:
-            out["dbs"] = [f"<list_database_names failed: {type(e).__name__}: {e}>"]
+        if with_dbs:
+            try:
+                _DB_LIST["dbs"] = client.list_database_names()
+            except Exception as e:
+                _DB_LIST["dbs"] = [f"<list_database_names failed: {type(e).__name__}: {e}>"]
+            _DB_LIST["ts"] = time.monotonic()
+        out["dbs"] = list(_DB_LIST["dbs"])
 
         out["ok"] = True
         return out
 
     except PyMongoError as e:
         out["error"] = f"{type(e).__name__}: {e}"
-        out["traceback"] = traceback.format_exc()
+        _LAST_EXC["exc"] = e
+        if include_tb:
+            out["traceback"] = traceback.format_exc()
         return out
     except Exception as e:
         out["error"] = f"{type(e).__name__}: {e}"
-        out["traceback"] = traceback.format_exc()
+        _LAST_EXC["exc"] = e
+        if include_tb:
+            out["traceback"] = traceback.format_exc()
         return out
 
 
+# ---------------- background poller ----------------
+# Callbacks never touch the network for the ping; they read the latest snapshot.
+
+# The poll doubles as the heartbeat: pinging this often keeps a pooled socket in
+# use, so Atlas-side idle cutoffs don't force a fresh TLS + SCRAM handshake.
+POLL_INTERVAL_S = 10.0
+# "started"/"done" count polls so a REFRESH can wait for one that began after the click.
+_LATEST = {"ping": None, "started": 0, "done": 0}
+_LATEST_COND = threading.Condition()
+_REFRESH_EVENT = threading.Event()
+
+
+def latest_ping() -> dict | None:
+    with _LATEST_COND:
+        snap = _LATEST["ping"]
+    return dict(snap) if snap is not None else None
+
+
+def request_refresh(wait_s: float = 0.0) -> bool:
+    """Wake the poller; optionally wait up to wait_s for a ping started after this call.
+
+    Returns True if that fresh result has been published.
+    """
+    clear_dns_cache()
+    with _LATEST_COND:
+        target = _LATEST["started"] + 1
+    _REFRESH_EVENT.set()
+    with _LATEST_COND:
+        return _LATEST_COND.wait_for(lambda: _LATEST["done"] >= target, timeout=wait_s)
+
+
+def _poll_loop() -> None:
+    full = True
+    while True:
+        _REFRESH_EVENT.clear()
+        with _LATEST_COND:
+            _LATEST["started"] += 1
+            gen = _LATEST["started"]
+
+        result = None
+        uri = MONGODB_URI
+        if uri:
+            try:
+                result = mongo_ping_debug(uri, timeout_ms=15000, full=full)
+            except Exception as e:
+                log(f"poller crashed: {type(e).__name__}: {e}")
+
+        with _LATEST_COND:
+            if result is not None:
+                _LATEST["ping"] = result
+            _LATEST["done"] = gen
+            _LATEST_COND.notify_all()
+        # a REFRESH click wakes us early and asks for the full status (db list included)
+        full = _REFRESH_EVENT.wait(POLL_INTERVAL_S)
+
+
+_POLLER = threading.Thread(target=_poll_loop, name="mongo-poller", daemon=True)
+_POLLER.start()
+
+
+# Runtime facts don't change for the life of the process; render them once.
+_RUNTIME_TEXT = "\n".join(
+    [
+        "=== RUNTIME ===",
+        f"python:         {platform.python_version()}",
+        f"executable:     {sys.executable}",
+        f"platform:       {platform.platform()}",
+        f"openssl:        {ssl.OPENSSL_VERSION}",
+        f"certifi_where:  {_CA_FILE}",
+    ]
+)
+
+_RENDER_ENV_KEYS = ("RENDER", "RENDER_SERVICE_ID", "RENDER_SERVICE_NAME", "PORT", "PYTHON_VERSION")
+
+
+def _dns_sections(atlas_host: str) -> list[str]:
+    bucket = _dns_bucket()
+    srv = _cached_srv(atlas_host, bucket)
+    records = srv["records"] or []
+    shard_hosts = [r["target"] for r in records]
+
+    srv_lines = [
+        "=== DNS SRV RECORDS ===",
+        f"srv_ok:         {srv['ok']}",
+        f"srv_query:      {srv['query']}",
+    ]
+    srv_lines += [f"  - {r['target']}:{r['port']} (prio={r['priority']} weight={r['weight']})" for r in records]
+    if srv["error"]:
+        srv_lines.append(f"srv_error:      {srv['error']}")
+
+    if shard_hosts:
+        results = _DNS_POOL.map(_cached_host_ips, shard_hosts, [bucket] * len(shard_hosts))
+        host_text = "\n".join(
+            f"{h} -> ok={res['ok']} ips={res['ips']} err={res['error']}" for h, res in zip(shard_hosts, results)
+        )
+    else:
+        host_text = "<no shard hosts found>"
+
+    return ["\n".join(srv_lines), f"=== DNS CHECK FOR SHARD HOSTS ===\n{host_text}"]
+
+
+def _ping_section() -> str:
+    m = latest_ping()
+    if m is None:
+        return "=== PYMONGO PING ===\n<no ping result yet, poller still starting>"
+
+    text = (
+        "=== PYMONGO PING ===\n"
+        f"mongo_ok:       {m['ok']}\n"
+        f"ping_ok:        {m['ping_ok']}\n"
+        f"timeout_ms:     {m['timeout_ms']}\n"
+        f"checked_at:     {m['checked_at'].isoformat()}"
+    )
+    dbs, error, tb = m["dbs"], m["error"], m["traceback"]
+    if dbs:
+        text += f"\ndbs:            {dbs}"
+    if error:
+        text += f"\nmongo_error:    {error}"
+    if tb:
+        text += f"\n\n--- pymongo traceback ---\n{tb.rstrip()}"
+    elif error:
+        text += "\nmongo_traceback: see /debug/tb"
+    return text
+
+
 def build_debug_text() -> str:
     now = datetime.now(timezone.utc)
-    uri = os.getenv("MONGODB_URI", "")
+    uri = MONGODB_URI
     uri_present = bool(uri)
-    uri_safe = safe_uri_summary(uri)
     atlas_host = get_atlas_host_from_uri(uri) if uri_present else None
 
-    lines = []
-    lines.append("=== MONGODB ATLAS DEBUG (Dash) ===")
-    lines.append(f"now_utc:        {now.isoformat()}")
-    lines.append(f"app_start_utc:  {APP_START_UTC.isoformat()}")
-    lines.append("")
-    lines.append("=== RUNTIME ===")
-    lines.append(f"python:         {platform.python_version()}")
-    lines.append(f"executable:     {sys.executable}")
-    lines.append(f"platform:       {platform.platform()}")
-    lines.append(f"openssl:        {ssl.OPENSSL_VERSION}")
-    lines.append(f"certifi_where:  {certifi.where()}")
-    lines.append("")
-    lines.append("=== ENV ===")
-    lines.append(f"MONGODB_URI set: {uri_present}")
-    lines.append(f"MONGODB_URI safe: {uri_safe}")
-
-    lines.append("")
-    lines.append("=== RENDER ENV (if present) ===")
-    for k in ["RENDER", "RENDER_SERVICE_ID", "RENDER_SERVICE_NAME", "PORT", "PYTHON_VERSION"]:
-        v = os.getenv(k)
-        if v is not None:
-            lines.append(f"{k}: {v}")
+    render_env = "".join(f"\n{k}: {v}" for k in _RENDER_ENV_KEYS if (v := os.getenv(k)) is not None)
 
-    if not uri_present:
-        lines.append("")
-        lines.append("=== NEXT STEP ===")
-        lines.append("Set MONGODB_URI in Render Environment variables (no quotes).")
-        return "\n".join(lines)
-
-    lines.append("")
-    lines.append("=== SRV HOST ===")
-    lines.append(f"atlas_host:     {atlas_host}")
-    lines.append("NOTE: Atlas SRV hosts often do NOT have A/AAAA records. SRV is what matters.")
+    sections = [
+        "=== MONGODB ATLAS DEBUG (Dash) ===\n"
+        f"now_utc:        {now.isoformat()}\n"
+        f"app_start_utc:  {APP_START_ISO}",
+        _RUNTIME_TEXT,
+        "=== ENV ===\n"
+        f"MONGODB_URI set: {uri_present}\n"
+        f"MONGODB_URI safe: {safe_uri_summary(uri)}",
+        f"=== RENDER ENV (if present) ==={render_env}",
+    ]
 
+    if not uri_present:
+        sections.append("=== NEXT STEP ===\nSet MONGODB_URI in Render Environment variables (no quotes).")
+        return "\n\n".join(sections)
+
+    sections.append(
+        "=== SRV HOST ===\n"
+        f"atlas_host:     {atlas_host}\n"
+        "NOTE: Atlas SRV hosts often do NOT have A/AAAA records. SRV is what matters."
+    )
     if atlas_host:
-        lines.append("")
-        lines.append("=== DNS SRV RECORDS ===")
-        srv = srv_records_debug(atlas_host)
-        lines.append(f"srv_ok:         {srv['ok']}")
-        lines.append(f"srv_query:      {srv['query']}")
-        shard_hosts = []
-        if srv["records"]:
-            for r in srv["records"]:
-                shard_hosts.append(r["target"])
-                lines.append(f"  - {r['target']}:{r['port']} (prio={r['priority']} weight={r['weight']})")
-        if srv["error"]:
-            lines.append(f"srv_error:      {srv['error']}")
-
-        lines.append("")
-        lines.append("=== DNS CHECK FOR SHARD HOSTS ===")
-        if shard_hosts:
-            for h in shard_hosts:
-                res = resolve_host_ips(h)
-                lines.append(f"{h} -> ok={res['ok']} ips={res['ips']} err={res['error']}")
-        else:
-            lines.append("<no shard hosts found>")
-
-    lines.append("")
-    lines.append("=== PYMONGO PING ===")
-    m = mongo_ping_debug(uri, timeout_ms=15000)
-    lines.append(f"mongo_ok:       {m['ok']}")
-    lines.append(f"ping_ok:        {m['ping_ok']}")
-    lines.append(f"timeout_ms:     {m['timeout_ms']}")
-    if m["dbs"]:
-        lines.append(f"dbs:            {m['dbs']}")
-    if m["error"]:
-        lines.append(f"mongo_error:    {m['error']}")
-    if m["traceback"]:
-        lines.append("")
-        lines.append("--- pymongo traceback ---")
-        lines.append(m["traceback"].rstrip())
-
-    lines.append("")
-    lines.append("=== ROLLING LOG ===")
-    if LOG_LINES:
-        lines.extend(LOG_LINES[-MAX_LOG_LINES:])
-    else:
-        lines.append("<no log lines yet>")
+        sections += _dns_sections(atlas_host)
+    sections.append(_ping_section())
 
-    return "\n".join(lines)
+    log_lines = log_snapshot()
+    sections.append("=== ROLLING LOG ===\n" + ("\n".join(log_lines) if log_lines else "<no log lines yet>"))
+
+    return "\n\n".join(sections)
 
 
 # ---------------- Dash app ----------------
 
-app = dash.Dash(__name__)
+# Dash serializes layouts and callback payloads through plotly's JSON helper,
+# which picks orjson automatically when it is installed (see requirements.txt).
+app = dash.Dash(__name__, compress=True)
 app.config.suppress_callback_exceptions = True
 server = app.server
 
@@ -243,10 +419,24 @@ def health():
     return {
         "ok": True,
         "utc": datetime.now(timezone.utc).isoformat(),
-        "start_utc": APP_START_UTC.isoformat(),
+        "start_utc": APP_START_ISO,
     }
 
 
+@server.route("/debug/tb")
+def debug_traceback():
+    tb = last_traceback_text()
+    return tb or "<no pymongo error recorded yet>", 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+
+_DEBUG_PRE_STYLE = {
+    "border": "1px solid #000",
+    "padding": "12px",
+    "whiteSpace": "pre-wrap",
+    "fontSize": "12px",
+    "marginTop": "12px",
+}
+
 app.layout = html.Div(
     [
         html.H3("MongoDB Atlas Debug Dashboard"),
@@ -255,42 +445,96 @@ app.layout = html.Div(
         html.Div(
             [
                 html.A("Health check", href="/health", target="_blank"),
+                " | ",
+                html.A("Last pymongo traceback", href="/debug/tb", target="_blank"),
             ],
             style={"marginBottom": "8px"},
         ),
 
         html.Button("REFRESH", id="refresh-btn", n_clicks=0),
         dcc.Interval(id="auto-refresh", interval=15_000, n_intervals=0),
+        # signature of what this browser last received, so idle ticks can skip the payload
+        dcc.Store(id="debug-sig"),
 
         # ✅ renders immediately, then callback replaces it
         html.Pre(
             id="debug-output",
             children=INITIAL_TEXT,
-            style={
-                "border": "1px solid #000",
-                "padding": "12px",
-                "whiteSpace": "pre-wrap",
-                "fontSize": "12px",
-                "marginTop": "12px",
-            },
+            style=_DEBUG_PRE_STYLE,
         ),
     ],
     style={"padding": "12px"},
 )
 
 
-@app.callback(
+# Even when nothing changed, re-send the full text at least this often so the
+# timestamps and rolling log don't go stale forever.
+STATUS_MAX_AGE_S = 60
+
+_TEXT_HEADERS = {"Content-Type": "text/plain; charset=utf-8", "Cache-Control": "no-store"}
+# how long a REFRESH request waits for the poller's fresh ping (matches the ping timeout)
+REFRESH_WAIT_S = 15.0
+
+
+def status_signature() -> str:
+    m = latest_ping()
+    bucket = int(time.monotonic() // STATUS_MAX_AGE_S)
+    parts = [None, bucket] if m is None else [m["ok"], m["error"], list(m["dbs"]), bucket]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+# Served straight from Flask (gzipped via compress=True) instead of through a Dash
+# callback, so the multi-KB text skips Dash's JSON round-trip.
+@server.route("/debug.txt")
+def debug_text():
+    try:
+        log("debug.txt served")
+        fresh = True
+        if request.args.get("refresh") == "1":
+            fresh = request_refresh(wait_s=REFRESH_WAIT_S)
+
+        sig = status_signature()
+        if request.args.get("sig") == sig:
+            return "", 204, _TEXT_HEADERS
+        if not fresh:
+            # the poller hasn't caught up; send no sig so the next tick fetches the full text
+            return build_debug_text(), 200, _TEXT_HEADERS
+        return build_debug_text(), 200, {**_TEXT_HEADERS, "X-Debug-Sig": sig}
+    except Exception as e:
+        tb = traceback.format_exc()
+        return f"DEBUG CALLBACK CRASHED:\n{type(e).__name__}: {e}\n\n{tb}", 200, _TEXT_HEADERS
+
+
+# REFRESH asks the poller for a full status; interval ticks send the last signature
+# this browser saw and get a 204 (no update) when nothing changed.
+app.clientside_callback(
+    """
+    function(_clicks, _ticks, lastSig) {
+        const noUpdate = window.dash_clientside.no_update;
+        const triggered = window.dash_clientside.callback_context.triggered;
+        const params = new URLSearchParams();
+        if (triggered.some(t => t.prop_id === "refresh-btn.n_clicks")) {
+            params.set("refresh", "1");
+        } else if (lastSig && triggered.some(t => t.prop_id === "auto-refresh.n_intervals")) {
+            params.set("sig", lastSig);
+        }
+        return fetch("/debug.txt?" + params.toString(), {cache: "no-store"})
+            .then(r => {
+                if (r.status === 204) {
+                    return [noUpdate, noUpdate];
+                }
+                const sig = r.headers.get("X-Debug-Sig");
+                return r.text().then(text => [text, sig]);
+            })
+            .catch(e => ["DEBUG FETCH FAILED:\n" + e, noUpdate]);
+    }
+    """,
     Output("debug-output", "children"),
+    Output("debug-sig", "data"),
     Input("refresh-btn", "n_clicks"),
     Input("auto-refresh", "n_intervals"),
+    State("debug-sig", "data"),
 )
-def refresh_debug(_clicks, _ticks):
-    try:
-        log("refresh_debug fired")
-        return build_debug_text()
-    except Exception as e:
-        tb = traceback.format_exc()
-        return f"DEBUG CALLBACK CRASHED:\n{type(e).__name__}: {e}\n\n{tb}"
 
 
 if __name__ == "__main__":
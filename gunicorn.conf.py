@@ -0,0 +1,13 @@
+import os
+
+# One process owns the MongoClient pool, the background poller and the DNS pool;
+# callbacks run concurrently on threads and share them. Extra worker processes
+# would each open their own pool to Atlas.
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = 1
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# The poller thread is started at import; preloading would start it in the
+# master and lose it across the fork.
+preload_app = False